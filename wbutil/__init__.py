@@ -5,20 +5,103 @@ wbutil/__init__.py
 
 Main manifest of wbutil modules.
 
+Submodules are imported lazily (PEP 562): a public name is resolved to its
+submodule on first access, so `import wbutil' only pays for what's used. Set
+WBUTIL_EAGER_IMPORT in the environment to resolve everything up front (handy
+for catching broken imports in CI).
+
 Will Badart <wbadart@live.com>
 created: JAN 2018
 '''
 
-from . import coroutine
-from . import func
-from . import fs
-from . import math
-from . import misc
-from . import pipeline
-
-from .coroutine import *
-from .fs import *
-from .func import *
-from .math import *
-from .misc import *
-from .pipeline import *
+from importlib import import_module as _import_module
+from os import environ as _environ
+
+_SUBMODULES = (
+    'asyncpipeline',
+    'coroutine',
+    'fs',
+    'func',
+    'math',
+    'misc',
+    'pipeline',
+)
+
+# Nested submodules re-exported at the top level (`from .math import *' used
+# to bring these along)
+_NESTED = {
+    'naivebayes': 'math.naivebayes',
+    'stat': 'math.stat',
+}
+
+# Maps each public name to the submodule which defines it
+_LAZY = {
+    'broadcast': 'coroutine',
+    'broadcast_batched': 'coroutine',
+    'prime_coroutine': 'coroutine',
+
+    'fast_dumps': 'fs',
+    'saveobj': 'fs',
+    'tryopen': 'fs',
+    'PersistentDict': 'fs',
+
+    'autocurry': 'func',
+    'compose': 'func',
+    'partialright': 'func',
+    'starcompose': 'func',
+    'cmap': 'func',
+    'cfilter': 'func',
+    'creduce': 'func',
+    'lmap': 'func',
+    'lfilter': 'func',
+    'identity': 'func',
+    'pred_negate': 'func',
+    'memoize_predicate': 'func',
+
+    'NaiveBayes': 'math',
+    'ConfusionMatrix': 'math',
+    'mean': 'math',
+    'median': 'math',
+    'variance': 'math',
+    'std': 'math',
+
+    'pair': 'misc',
+    'randreal': 'misc',
+    'retry': 'misc',
+    'signal_handler': 'misc',
+    'slow': 'misc',
+    'timeout': 'misc',
+    'uniq': 'misc',
+
+    'Pipeline': 'pipeline',
+    'AsyncPipeline': 'asyncpipeline',
+}
+
+__all__ = sorted(_LAZY)
+
+
+def __getattr__(name: str):
+    '''Import the submodule providing `name' and cache the result.'''
+    if name in _SUBMODULES:
+        value = _import_module('.' + name, __name__)
+    elif name in _NESTED:
+        value = _import_module('.' + _NESTED[name], __name__)
+    elif name in _LAZY:
+        module = _import_module('.' + _LAZY[name], __name__)
+        value = getattr(module, name)
+    else:
+        raise AttributeError(
+            'module {!r} has no attribute {!r}'.format(__name__, name))
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(
+        set(globals()) | set(_SUBMODULES) | set(_NESTED) | set(_LAZY))
+
+
+if _environ.get('WBUTIL_EAGER_IMPORT'):
+    for _name in _SUBMODULES + tuple(_NESTED) + tuple(_LAZY):
+        __getattr__(_name)
+    del _name
@@ -0,0 +1,189 @@
+#!/usr/bin/env python
+
+'''
+wbutil/asyncpipeline.py
+
+asyncio counterpart of wbutil.pipeline, for I/O-bound coroutine functions.
+Kept in its own module so importing the threaded Pipeline doesn't pay for
+asyncio.
+
+Will Badart <wbadart@live.com>
+created: OCT 2026
+'''
+
+from asyncio import (
+    Event, Queue, Semaphore, TimeoutError as AsyncTimeoutError, ensure_future,
+    gather, wait_for)
+from typing import (
+    Any, Awaitable, Callable, Dict, Hashable, Iterable, List, Optional,
+    TypeVar)
+
+__all__ = [
+    'AsyncPipeline',
+]
+
+_FuncArgT = TypeVar('_FuncArgT')
+_FuncRetT = TypeVar('_FuncRetT')
+
+
+class _Slot(object):
+    '''
+    Holds the result of a single item (or the exception func raised for it)
+    and the event that announces it.
+    '''
+    __slots__ = ('event', 'result', 'error')
+
+    def __init__(self) -> None:
+        self.event = Event()
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+
+
+class AsyncPipeline(object):
+    '''
+    Like Pipeline, but `func' is a coroutine function awaited by `ntasks'
+    worker tasks on the running event loop instead of being run on threads.
+    Use with `async with', or await start()/shutdown().
+
+    >>> import asyncio
+    >>> async def divide(x):
+    ...     await asyncio.sleep(0)
+    ...     return 10 // x
+    ...
+    >>> asyncio.run(AsyncPipeline(divide).map([1, 2, 5]))
+    [10, 5, 2]
+    >>> async def divide_all(xs):
+    ...     async with AsyncPipeline(divide) as p:
+    ...         keys = [await p.put(x) for x in xs]
+    ...         return [await p.get(key) for key in keys]
+    ...
+    >>> asyncio.run(divide_all([2, 5]))
+    [5, 2]
+    >>> asyncio.run(divide_all([2, 0]))
+    Traceback (most recent call last):
+      ...
+    ZeroDivisionError: integer division or modulo by zero
+    '''
+
+    def __init__(
+            self,
+            func: Callable[[_FuncArgT], Awaitable[_FuncRetT]],
+            maxsize: int=0,
+            ntasks: int=4) -> None:
+        if ntasks < 1:
+            raise ValueError('ntasks must be positive, got %r' % ntasks)
+        self._func = func
+        self._maxsize = maxsize
+        self._ntasks = ntasks
+        # Created on start: asyncio primitives belong to the loop they're
+        # first used on
+        self._q: Optional[Queue] = None
+        self._tasks: list = []
+        self._slots: Dict[Hashable, _Slot] = {}
+        self._nextkey = 0
+
+        # Track queue state; enforce one-time usage
+        self._started = False
+        self._stopped = False
+
+    async def _worker(self) -> None:
+        get = self._q.get
+        func = self._func
+        while True:
+            key, item, slot = await get()
+            if key is None:
+                break
+            # Always set the event, so a failed item can't leave its reader
+            # waiting forever
+            try:
+                slot.result = await func(item)
+            except Exception as exc:
+                slot.error = exc
+            finally:
+                slot.event.set()
+
+    async def __aenter__(self) -> 'AsyncPipeline':
+        '''Start the worker tasks.'''
+        if self._started:
+            raise RuntimeError('Pipelines cannot be reused')
+        self._started = True
+        self._q = Queue(self._maxsize)
+        self._tasks = [
+            ensure_future(self._worker()) for _ in range(self._ntasks)]
+        return self
+
+    async def __aexit__(
+            self,
+            exception_t=Exception,
+            exception=None,
+            traceback=None) -> None:
+        '''
+        Stop the worker tasks once everything queued has been processed. Does
+        nothing if the Pipeline has already been stopped.
+        '''
+        if self._stopped:
+            return
+        for _ in self._tasks:
+            await self._q.put((None, None, None))
+        await gather(*self._tasks)
+        self._stopped = True
+
+    async def put(self, item: _FuncArgT, key: Hashable=None) -> Hashable:
+        '''Add an item to apply func to. Returns the key to pass to `get'.'''
+        if self._stopped:
+            raise RuntimeError('this Pipeline has already been stopped')
+        if not self._started:
+            raise RuntimeError('start the Pipeline before putting items')
+        if key is None:
+            key = self._nextkey
+            self._nextkey += 1
+        slot = self._slots[key] = _Slot()
+        await self._q.put((key, item, slot))
+        return key
+
+    async def get(self, key: Hashable, timeout: float=None) -> _FuncRetT:
+        '''
+        Get the result from an individual item. Raises TimeoutError if it isn't
+        ready within `timeout' seconds, and KeyError for an unknown key. If
+        func raised for the item, that exception is re-raised here.
+        '''
+        slot = self._slots[key]
+        try:
+            await wait_for(slot.event.wait(), timeout)
+        except AsyncTimeoutError:
+            # Before 3.11, asyncio's TimeoutError isn't the builtin one
+            raise TimeoutError(
+                'result for key %r not ready' % (key,)) from None
+        if slot.error is not None:
+            raise slot.error
+        return slot.result
+
+    async def map(self, iterable: Iterable[_FuncArgT]) -> List[_FuncRetT]:
+        '''
+        Apply AsyncPipeline.func to each item in the argument iterable, at
+        most `ntasks' at a time. This doesn't go through the queue, so the
+        Pipeline needn't be started.
+        '''
+        limit = Semaphore(self._ntasks)
+        func = self._func
+
+        async def _run(item):
+            async with limit:
+                return await func(item)
+        return list(await gather(*map(_run, iterable)))
+
+    async def apply(self, iterable: Iterable[_FuncArgT]) -> None:
+        '''
+        Procedure variant of map. Apply AsyncPipeline.func over iterable, but
+        do not aggregate and return procedure results.
+        '''
+        await self.map(iterable)
+
+    @property
+    def func(self) -> Callable[[_FuncArgT], Awaitable[_FuncRetT]]:
+        '''Allow user code to inspect (though not modify) func.'''
+        return self._func
+
+    # Nice aliases for context functions, for use when `with' not appropriate
+    start = __aenter__
+    shutdown = __aexit__
@@ -11,17 +11,24 @@ created: FEB 2018
 
 import wbutil.misc as m
 
-from asyncio import sleep
-from functools import wraps
-from pprint import pprint
-from time import time
+from collections import deque
+from functools import update_wrapper
 from typing import Any, Callable, Coroutine, Generator
 
 __all__ = [
     'broadcast',
+    'broadcast_batched',
     'prime_coroutine',
 ]
 
+# Only carry over what's needed for introspection; skip __dict__ merging and
+# the __wrapped__ back-reference
+_WRAPPER_ASSIGNMENTS = ('__name__', '__doc__')
+
+# Code object flags, as in inspect.CO_VARARGS and inspect.CO_VARKEYWORDS
+_CO_VARARGS = 0x04
+_CO_VARKEYWORDS = 0x08
+
 
 def prime_coroutine(func: Callable) -> Callable:
     '''
@@ -29,21 +36,40 @@ def prime_coroutine(func: Callable) -> Callable:
     construction (so you don't have to remember to prime the coroutine).
     TODO: complete example
     '''
-    def _impl(*args, **kwargs):
-        routine = func(*args, **kwargs)
-        routine.send(None)
-        return routine
-    return _impl
+    # Read the parameter shape straight off the code object (importing
+    # inspect just for this would dwarf the rest of the module's load time)
+    code = getattr(func, '__code__', None)
+    if code is not None and not (
+            code.co_argcount or code.co_kwonlyargcount
+            or code.co_flags & _CO_VARKEYWORDS):
+        if code.co_flags & _CO_VARARGS:
+            # Only *args (e.g. broadcast): skip packing an empty kwargs dict
+            def _impl(*args):
+                routine = func(*args)
+                routine.send(None)
+                return routine
+        else:
+            def _impl():
+                routine = func()
+                routine.send(None)
+                return routine
+    else:
+        def _impl(*args, **kwargs):
+            routine = func(*args, **kwargs)
+            routine.send(None)
+            return routine
+    return update_wrapper(
+        _impl, func, assigned=_WRAPPER_ASSIGNMENTS, updated=())
 
 
 def iteratee_to_coroutine(func: Callable) -> Callable:
     '''
     '''
-    @wraps(func)
     def _impl(target):
         while True:
             target.send(func((yield)))
-    return _impl
+    return update_wrapper(
+        _impl, func, assigned=_WRAPPER_ASSIGNMENTS, updated=())
 
 
 @prime_coroutine
@@ -52,10 +78,70 @@ def broadcast(*targets: Coroutine) -> Generator:
     Send an item to multiple target coroutines.
     TODO: complete example
     '''
-    while True:
-        item = (yield)
-        for target in targets:
-            target.send(item)
+    # Bind each target's send once; unroll the common narrow fan-outs
+    sends = tuple(target.send for target in targets)
+    if len(sends) == 1:
+        send0, = sends
+        while True:
+            send0((yield))
+    elif len(sends) == 2:
+        send0, send1 = sends
+        while True:
+            item = (yield)
+            send0(item)
+            send1(item)
+    else:
+        while True:
+            item = (yield)
+            for send in sends:
+                send(item)
+
+
+@prime_coroutine
+def broadcast_batched(batch_size: int, *targets: Coroutine) -> Generator:
+    '''
+    Like `broadcast', but buffer `batch_size' items before sending them on.
+    Each target receives the whole batch (in order) before the next target
+    does, which lets the fan-out run in C via map. Any partial batch is
+    flushed when the coroutine is closed.
+
+    >>> @prime_coroutine
+    ... def collect(into):
+    ...     while True:
+    ...         into.append((yield))
+    ...
+    >>> a, b = [], []
+    >>> fanout = broadcast_batched(2, collect(a), collect(b))
+    >>> for i in range(3):
+    ...     fanout.send(i)
+    ...
+    >>> a, b
+    ([0, 1], [0, 1])
+    >>> fanout.close()
+    >>> a, b
+    ([0, 1, 2], [0, 1, 2])
+    >>> broadcast_batched(0, collect(a))
+    Traceback (most recent call last):
+      ...
+    ValueError: batch_size must be positive, got 0
+    '''
+    if batch_size < 1:
+        raise ValueError('batch_size must be positive, got %r' % batch_size)
+    sends = tuple(target.send for target in targets)
+    # A zero-length deque consumes an iterator without storing anything
+    consume = deque(maxlen=0).extend
+    batch: list = []
+    append = batch.append
+    try:
+        while True:
+            append((yield))
+            if len(batch) == batch_size:
+                for send in sends:
+                    consume(map(send, batch))
+                batch.clear()
+    except GeneratorExit:
+        for send in sends:
+            consume(map(send, batch))
 
 
 @prime_coroutine
@@ -75,6 +161,7 @@ def pprinter():
     Sink for pretty printing pipeline items.
     TODO: complete example
     '''
+    from pprint import pprint
     while True:
         item = (yield)
         pprint(item)
@@ -88,11 +175,13 @@ class slow(m.slow):
     def __call__(self, func: Callable) -> Any:
         '''
         '''
-        @wraps(func)
         def _impl(*args, **kwargs):
+            from asyncio import sleep
+            from time import time
             time_elapsed = time() - self.last_call
             if time_elapsed < self.wait:
                 yield from sleep(self.wait - time_elapsed)
             self.last_call = time()
             return func(*args, **kwargs)
-        return _impl
+        return update_wrapper(
+            _impl, func, assigned=_WRAPPER_ASSIGNMENTS, updated=())
@@ -10,10 +10,15 @@ created: JAN 2018
 '''
 
 import re
-from functools import partial, reduce, wraps
-from inspect import signature
-from itertools import chain
-from typing import Any, Callable, Generic, Iterable, TypeVar, Union
+from dis import get_instructions
+from functools import lru_cache, partial, reduce, wraps
+from inspect import CO_VARARGS, CO_VARKEYWORDS, signature
+from operator import attrgetter, itemgetter
+from types import FunctionType
+from typing import (
+    Any, Callable, Generic, Iterable, Iterator, List, Optional, TypeVar,
+    Union)
+from weakref import WeakKeyDictionary
 
 __all__ = [
     'autocurry',
@@ -27,6 +32,7 @@ __all__ = [
     'lfilter',
     'identity',
     'pred_negate',
+    'memoize_predicate',
 ]
 
 _ComposeRetT = TypeVar('_ComposeRetT')
@@ -35,6 +41,12 @@ _NAryFunc = Callable[[Iterable[Any]], Iterable[Any]]
 _UnaryFunc = Callable[[Any], Any]
 _T = TypeVar('_T')
 
+# Parameter counts of functions wrapped by autocurry
+_ARITY_CACHE: WeakKeyDictionary = WeakKeyDictionary()
+
+# Maps lambda code objects to their operator equivalent (or None)
+_GETTER_CACHE: WeakKeyDictionary = WeakKeyDictionary()
+
 
 class autocurry(Generic[_CurryReturnT]):
     '''
@@ -55,28 +67,40 @@ class autocurry(Generic[_CurryReturnT]):
             *args,
             **kwargs) -> None:
         self.func = func
-        try:
-            self.nparams = len(signature(func).parameters)
-        except ValueError:
-            func = getattr(func, 'func', func)  # if func is a partial
-            prototype = re.search('^[\w_]+(\(.*\))', func.__doc__).groups()[0]
-            prototype = prototype[1:-1]
-            self.nparams = len(prototype.split(','))
-
+        self.nparams = _arity(func)
         self.args = args
         self.keywords = kwargs
 
+    @classmethod
+    def _clone(
+            cls,
+            func: Callable[..., _CurryReturnT],
+            nparams: int,
+            args: tuple,
+            keywords: dict) -> 'autocurry':
+        '''Build a partial application without re-deriving the arity.'''
+        self = cls.__new__(cls)
+        self.func = func
+        self.nparams = nparams
+        self.args = args
+        self.keywords = keywords
+        return self
+
     def __call__(self, *args, **kwargs) -> Union['autocurry', _CurryReturnT]:
         '''
         Partially apply args and kwargs to the wrapped function (full
         application if all parameters have been filled.
         '''
-        pos_args = chain(self.args, args)
-        keywords = dict(**self.keywords, **kwargs)
-        if len(self.args + args) == self.nparams:
+        pos_args = self.args + args
+        if kwargs:
+            keywords = {**self.keywords, **kwargs} if self.keywords else kwargs
+        else:
+            keywords = self.keywords
+        if len(pos_args) == self.nparams:
             return self.func(*pos_args, **keywords)
         else:
-            return type(self)(self.func, *pos_args, **keywords)
+            return type(self)._clone(
+                self.func, self.nparams, pos_args, keywords)
 
 
 class compose(Generic[_ComposeRetT]):
@@ -90,12 +114,35 @@ class compose(Generic[_ComposeRetT]):
     '20'
     '''
 
+    __slots__ = ('funcs', '_call')
+
     def __init__(self, *funcs: _UnaryFunc) -> None:
         self.funcs = funcs
+        # Splice in the stages of nested compositions of the same kind so
+        # they run as one flat pipeline (self.funcs keeps them as passed)
+        cls = type(self)
+        if any(type(f) is cls for f in funcs):
+            funcs = tuple(_flatten(cls, funcs))
+        self._call = self._compile(funcs)
 
     def __call__(self, arg: Any) -> _ComposeRetT:
         '''Invoke the composed pipeline with the specified argument.'''
-        return reduce(lambda acc, f: f(acc), self.funcs, arg)
+        return self._call(arg)
+
+    @staticmethod
+    def _compile(funcs: tuple) -> Callable:
+        '''Generate a straight-line function which applies `funcs' in order.'''
+        if len(funcs) == 1:
+            return funcs[0]
+        return _codegen(
+            'def _composed(arg):',
+            ['arg = _f%d(arg)' % i for i in range(len(funcs))],
+            'return arg',
+            funcs)
+
+    def __reduce__(self) -> tuple:
+        '''Pickle by stages; the generated function is rebuilt on load.'''
+        return type(self), self.funcs
 
     def __reversed__(self) -> 'compose':
         '''
@@ -119,13 +166,26 @@ class starcompose(compose):
     ('2', '1')
     '''
 
+    __slots__ = ()
+
     # Overridden to annotate n-ary function support
     def __init__(self, *funcs: _NAryFunc) -> None:
         super().__init__(*funcs)
 
     def __call__(self, *args: Any) -> Any:
         '''Invoke the composed pipeline with unpacking.'''
-        return reduce(lambda acc, f: f(*acc), self.funcs, args)
+        return self._call(*args)
+
+    @staticmethod
+    def _compile(funcs: tuple) -> Callable:
+        '''Generate a straight-line function which applies `funcs' in order.'''
+        if len(funcs) == 1:
+            return funcs[0]
+        return _codegen(
+            'def _composed(*args):',
+            ['args = _f%d(*args)' % i for i in range(len(funcs))],
+            'return args',
+            funcs)
 
 
 class partialright(partial):
@@ -139,34 +199,48 @@ class partialright(partial):
     ['1', '2', '3', '4']
     '''
 
+    def __new__(
+            cls,
+            func: Callable,
+            *args: Any,
+            **kwargs: Any) -> 'partialright':
+        self = super().__new__(cls, func, *args, **kwargs)
+        # self.args never changes, so reverse it once up front
+        self._rargs = tuple(reversed(self.args))
+        return self
+
     def __call__(self, *args: Any, **kwargs: Any) -> Any:
         '''Call self as a function.'''
-        pos_args = chain(args, reversed(self.args))
-        keywords = self.keywords.copy()
-        keywords.update(kwargs)
-        return self.func(*pos_args, **keywords)
+        keywords = {**self.keywords, **kwargs} if kwargs else self.keywords
+        return self.func(*args, *self._rargs, **keywords)
 
 
-def cmap(iteratee: Callable[[Any], Any]) -> partial:
+def cmap(iteratee: Callable[[Any], Any]) -> Callable[[Iterable], Iterable]:
     '''
-    Curried map. Sugar for partial(map, iteratee).
+    Curried map. Sugar for partial(map, iteratee). Mapping `identity' is just
+    `iter', which skips calling it on every element.
 
     >>> from string import digits
     >>> transform = cmap(int)
     >>> list(transform(digits))
     [0, 1, 2, 3, 4, 5, 6, 7, 8, 9]
     '''
+    if iteratee is identity:
+        return iter
     return partial(map, iteratee)
 
 
 def cfilter(predicate: Callable[[Any], bool]) -> partial:
     '''
-    Curried filter. Sugar for partial(filter, predicate).
+    Curried filter. Sugar for partial(filter, predicate). Filtering on
+    `identity' is the same as filtering on None, which tests truthiness in C.
 
     >>> is1or2 = cfilter({1, 2}.__contains__)
     >>> list(is1or2(range(10)))
     [1, 2]
     '''
+    if predicate is identity:
+        predicate = None
     return partial(filter, predicate)
 
 
@@ -193,23 +267,36 @@ def creduce(iteratee: Callable[[Any], Any]) -> partial:
 def lmap(iteratee: Callable[[Any], Any], iterable: Iterable) -> list:
     '''
     Performs a mapping of `iteratee' over `iterable' and immediately
-    serializes result into a list.
+    serializes result into a list. An `iteratee' of None or `identity' just
+    copies `iterable' into a list.
 
     >>> lmap(str, range(10))
     ['0', '1', '2', '3', '4', '5', '6', '7', '8', '9']
     '''
+    if iteratee is None or iteratee is identity:
+        return list(iterable)
+    iteratee = _as_getter(iteratee)
+    # Comprehensions beat map for Python functions; map wins for C callables
+    if type(iteratee) is FunctionType:
+        return [iteratee(e) for e in iterable]
     return list(map(iteratee, iterable))
 
 
 def lfilter(predicate: Callable[[Any], bool], iterable: Iterable) -> list:
     '''
     Filters `iterable' on `predicate', immediately serializing results into a
-    list.
+    list. As with `filter', a None (or `identity') `predicate' keeps the
+    truthy elements.
 
     >>> odd = lambda x: x % 2 == 1
     >>> lfilter(odd, range(10))
     [1, 3, 5, 7, 9]
     '''
+    if predicate is None or predicate is identity:
+        return list(filter(None, iterable))
+    predicate = _as_getter(predicate)
+    if type(predicate) is FunctionType:
+        return [e for e in iterable if predicate(e)]
     return list(filter(predicate, iterable))
 
 
@@ -223,16 +310,128 @@ def identity(e: _T) -> _T:
     return e
 
 
-def pred_negate(predicate: Callable[..., bool]) -> Callable[..., bool]:
+def pred_negate(
+        predicate: Callable[..., bool],
+        cache: bool=False,
+        maxsize: Optional[int]=1024) -> Callable[..., bool]:
     '''
     Gives a function which returns the inverse of the argument predicate.
 
+    Set `cache' to memoize `predicate' (see `memoize_predicate') so repeated
+    calls with the same arguments don't re-run it. Only do so for pure
+    predicates of hashable arguments.
+
     >>> isodd = lambda x: x % 2 == 1
     >>> iseven = pred_negate(isodd)
     >>> iseven(10)
     True
     '''
+    if cache:
+        predicate = memoize_predicate(predicate, maxsize)
+
     @wraps(predicate)
     def _impl(*args, **kwargs):
         return not predicate(*args, **kwargs)
+    if cache:
+        _impl.cache_info = predicate.cache_info
     return _impl
+
+
+def memoize_predicate(
+        predicate: Callable[..., bool],
+        maxsize: Optional[int]=1024) -> Callable[..., bool]:
+    '''
+    Cache the results of a deterministic, side-effect-free predicate (e.g. to
+    filter data with many duplicates). Arguments must be hashable. Sugar for
+    functools.lru_cache(maxsize)(predicate).
+
+    >>> isprime = memoize_predicate(
+    ...     lambda n: all(n % d for d in range(2, n)))
+    >>> lfilter(isprime, [7, 7, 7, 8])
+    [7, 7, 7]
+    >>> isprime.cache_info().hits
+    2
+    '''
+    return lru_cache(maxsize=maxsize)(predicate)
+
+
+def _arity(func: Callable) -> int:
+    '''
+    Count the parameters of `func', falling back to parsing the prototype out
+    of the docstring for builtins without a signature. Cached per function.
+    '''
+    try:
+        return _ARITY_CACHE[func]
+    except (KeyError, TypeError):
+        pass
+    try:
+        nparams = len(signature(func).parameters)
+    except ValueError:
+        doc_func = getattr(func, 'func', func)  # if func is a partial
+        prototype = re.search(
+            r'^[\w_]+(\(.*\))', doc_func.__doc__).groups()[0]
+        prototype = prototype[1:-1]
+        nparams = len(prototype.split(','))
+    try:
+        _ARITY_CACHE[func] = nparams
+    except TypeError:  # not weak-referenceable
+        pass
+    return nparams
+
+
+def _flatten(cls: type, funcs: Iterable[Callable]) -> Iterator[Callable]:
+    '''Yield the stages of `funcs', expanding nested `cls' instances.'''
+    for f in funcs:
+        if type(f) is cls:
+            yield from _flatten(cls, f.funcs)
+        else:
+            yield f
+
+
+def _codegen(
+        header: str,
+        body: List[str],
+        footer: str,
+        funcs: tuple) -> Callable:
+    '''
+    Compile a function named `_composed' from the given source lines, with
+    `funcs' bound as _f0, _f1, ... in its globals (one statement per stage,
+    so there's no nesting limit on the number of stages).
+    '''
+    src = '\n    '.join([header] + body + [footer])
+    namespace = {'_f%d' % i: f for i, f in enumerate(funcs)}
+    exec(compile(src, '<compose>', 'exec'), namespace)
+    return namespace['_composed']
+
+
+def _as_getter(func: Callable) -> Callable:
+    '''
+    Swap a lambda of the shape `lambda x: x.attr' or `lambda x: x[const]' for
+    the equivalent operator.attrgetter/itemgetter, which map can call without
+    building a Python frame per element. Other callables pass through as-is.
+    '''
+    code = getattr(func, '__code__', None)
+    if code is None or func.__name__ != '<lambda>':
+        return func
+    try:
+        getter = _GETTER_CACHE[code]
+    except KeyError:
+        getter = _GETTER_CACHE[code] = _match_getter(code)
+    return func if getter is None else getter
+
+
+def _match_getter(code: Any) -> Optional[Callable]:
+    '''Recognize attribute/item access lambdas from their bytecode.'''
+    if (code.co_argcount != 1 or code.co_kwonlyargcount
+            or code.co_flags & (CO_VARARGS | CO_VARKEYWORDS)):
+        return None
+    ops = [(ins.opname, ins.argval) for ins in get_instructions(code)
+           if ins.opname not in ('RESUME', 'NOP', 'CACHE')]
+    if not ops or ops[0] != ('LOAD_FAST', code.co_varnames[0]):
+        return None
+    names = [op for op, _ in ops[1:]]
+    if names == ['LOAD_ATTR', 'RETURN_VALUE']:
+        return attrgetter(ops[1][1])
+    if names == ['LOAD_CONST', 'BINARY_SUBSCR', 'RETURN_VALUE']:
+        return itemgetter(ops[1][1])
+    return None
@@ -9,10 +9,13 @@ Will Badart <netid:wbadart>
 created: FEB 2018
 '''
 
-from collections import Counter, defaultdict
+from bisect import bisect_left
+from collections import Counter
 from csv import reader
+from itertools import repeat
+from math import exp, inf, log
 from pprint import pformat
-from typing import Sequence
+from typing import Iterable, Sequence
 
 __all__ = [
     'NaiveBayes',
@@ -29,11 +32,17 @@ class NaiveBayes(object):
             features: Sequence[str],
             *data: tuple,
             label_index=-1,
-            domains=None) -> None:
+            domains=None,
+            rows: Iterable[Sequence]=None) -> None:
         '''
         Construct a new naive bayes model with features `features' and training
         instances `data'.
 
+        Alternatively, pass an iterable of instances as `rows' to train in a
+        single streaming pass: rows are counted as they're read and are not
+        retained, so memory stays proportional to the number of distinct
+        values rather than the size of the data set.
+
         Specify the column of the label with `label_index' (negative numbers
         are interpreted as index from the right, e.g. label_index = -2 if the
         label is in the second to last column.
@@ -47,50 +56,52 @@ class NaiveBayes(object):
         self._label_index = (
             label_index if label_index >= 0 else len(features) + label_index)
         self._label = features[self._label_index]
+        # positions and names of the non-label columns
+        self._kept_indices = tuple(
+            i for i in range(len(features)) if i != self._label_index)
+        self._kept_features = tuple(features[i] for i in self._kept_indices)
         self._domains = domains or (_identity,) * len(features)
 
-        # self._counts tracks, for each class for each feature, the number of
-        # occurrences of each label
-        self._counts: dict = {
-            feature: defaultdict(Counter) for feature in features}
+        # self._counts maps (feature, value, label) to the number of training
+        # instances with that value and label; self._totals maps (feature,
+        # label) to the same summed over all values of the feature
+        self._counts: Counter = Counter()
+        self._totals: Counter = Counter()
+        self._label_counts: Counter = Counter()
 
-        for instance in data:
-            instance = tuple(
-                self._domains[i](val) for i, val in enumerate(instance))
-            for feat, val in self._genfeats(instance):
-                self._counts[feat][val][instance[self._label_index]] += 1
-            # indexing None moves us from the defaultdict into the Counter for
-            # the label counts
-            self._counts[self._label][None][instance[self._label_index]] += 1
+        if rows is not None:
+            self._train_stream(rows)
+        else:
+            self._train_columns(data)
+        self._build_tables()
 
     def predict(self, instance):
         '''
         Predict the label of the given unlabeled test instance.
 
             Y = argmax[yj in Y] P(yj) * PRODUCT[P(xi|yj) for xi in X]
-        '''
-        maxlabel, maxprob = None, 0.0
-        for label, count in self._counts[self._label][None].items():
 
-            # prior probability
-            labelprob = count / len(self._data)
-
-            # probability of feature=value given current label
-            for feat, val in self._genfeats(instance):
-                labelprob *= self.probability(feat, val, label)
+        Scores are accumulated as sums of logs so long instances don't
+        underflow to zero; ties go to the first label seen in training.
+        '''
+        if not self._classes:
+            return None, 0.0
 
-            if labelprob >= maxprob:
-                maxprob = labelprob
-                maxlabel = label
+        # scores[j] accumulates the log probability of self._classes[j]
+        scores = self._log_priors
+        unseen = self._log_zeros
+        table = self._table
+        for featval in self._genfeats(instance):
+            row = table.get(featval, unseen)
+            scores = [s + q for s, q in zip(scores, row)]
 
-        return maxlabel, maxprob
+        best = max(range(len(scores)), key=scores.__getitem__)
+        return self._classes[best], exp(scores[best])
 
     def probability(self, feature, value, class_):
         '''Read class counts to determine the probability of x_i give y_j.'''
-        count = self._counts[feature][value][class_]
-        # the frequency of label `class_' for all values of `feature'
-        total = sum(ct[class_] for ct in self._counts[feature].values())
-        return count / total
+        count = self._counts[feature, value, class_]
+        return count / self._totals[feature, class_]
 
     def prediction_report(self, instance):
         '''
@@ -113,17 +124,90 @@ class NaiveBayes(object):
         __init__.
         '''
         with open(path) as fs:
-            return cls(*map(tuple, reader(fs)), label_index=label_index)
+            rows = reader(fs)
+            features = tuple(next(rows))
+            return cls(features, label_index=label_index, rows=rows)
+
+    def _train_columns(self, data):
+        '''
+        Count an in-memory data set column-wise: apply each domain with map
+        and let Counter tally (value, label) pairs in C rather than looping
+        over every cell.
+        '''
+        nfeatures = len(self._features)
+        if any(len(instance) < nfeatures for instance in data):
+            # zip(*data) would truncate every column to the shortest row
+            self._train_stream(data)
+            return
+        self._n = len(data)
+        columns = [
+            col if domain is _identity else tuple(map(domain, col))
+            for domain, col in zip(self._domains, zip(*data))]
+        if not columns:
+            return
+        labels = columns[self._label_index]
+        for feat, col in self._genfeats(columns):
+            for (val, label), count in Counter(zip(col, labels)).items():
+                self._counts[feat, val, label] = count
+                self._totals[feat, label] += count
+        self._label_counts.update(labels)
+
+    def _train_stream(self, rows):
+        '''Count instances one at a time as they're read from `rows'.'''
+        domains = self._domains
+        convert = any(domain is not _identity for domain in domains)
+        counts_update = self._counts.update
+        label_counts = self._label_counts
+        kept_features = self._kept_features
+        n = 0
+        for n, instance in enumerate(rows, 1):
+            if convert:
+                instance = [
+                    domain(val) for domain, val in zip(domains, instance)]
+            label = instance[self._label_index]
+            label_counts[label] += 1
+            counts_update(zip(
+                kept_features, self._skiplabel(instance), repeat(label)))
+        self._n = n
+        for (feat, _, label), count in self._counts.items():
+            self._totals[feat, label] += count
+
+    def _build_tables(self):
+        '''
+        Precompute the log prior of each class and, for each (feature, value)
+        pair seen in training, the tuple of log P(value|class) for every class
+        (in the order of self._classes), so prediction is just lookups and
+        additions.
+        '''
+        self._classes = tuple(self._label_counts)
+        self._log_priors = tuple(
+            _log(self._label_counts[c] / self._n) for c in self._classes)
+        self._log_zeros = (-inf,) * len(self._classes)
+
+        class_index = {c: j for j, c in enumerate(self._classes)}
+        rows: dict = {}
+        for (feat, val, label), count in self._counts.items():
+            row = rows.get((feat, val))
+            if row is None:
+                row = rows[feat, val] = list(self._log_zeros)
+            row[class_index[label]] = _log(count / self._totals[feat, label])
+        self._table = {featval: tuple(row) for featval, row in rows.items()}
 
     def _skiplabel(self, tup):
-        '''Iterate over a tuple, skipping the label column.'''
-        return (e for i, e in enumerate(tup) if i != self._label_index)
+        '''
+        Iterate over a tuple, skipping the label column. A tuple shorter than
+        the feature list yields only the cells it has.
+        '''
+        kept = self._kept_indices
+        if len(tup) < len(self._features):
+            kept = kept[:bisect_left(kept, len(tup))]
+        return map(tup.__getitem__, kept)
 
     def _genfeats(self, instance):
         '''
         Iterate over a tuple, including feature name and skipping label column.
         '''
-        return self._skiplabel(zip(self._features, instance))
+        return zip(self._kept_features, self._skiplabel(instance))
 
     def __repr__(self):
         return '{cls}({features!r},\n{data},\nlabel_index={idx})'.format(
@@ -143,3 +227,8 @@ class NaiveBayes(object):
 def _identity(a):
     '''Returns the argument.'''
     return a
+
+
+def _log(p):
+    '''Natural log which maps a probability of zero to -inf.'''
+    return log(p) if p > 0 else -inf
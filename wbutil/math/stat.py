@@ -10,8 +10,10 @@ created: FEB 2018
 '''
 
 from collections import Counter
+from functools import wraps
 from numbers import Real
-from typing import Tuple, Sequence
+from operator import mul
+from typing import Any, Callable, Tuple, Sequence
 
 __all__ = [
     'ConfusionMatrix',
@@ -22,6 +24,23 @@ __all__ = [
 ]
 
 
+def _cachedmetric(func: Callable[[Any], float]) -> property:
+    '''
+    Read-only property whose value is memoized in the instance's `_cache'
+    dict (which ConfusionMatrix clears whenever its counts change).
+    '''
+    name = func.__name__
+
+    @wraps(func)
+    def _impl(self):
+        try:
+            return self._cache[name]
+        except KeyError:
+            value = self._cache[name] = func(self)
+            return value
+    return property(_impl)
+
+
 class ConfusionMatrix(object):
     '''
     Track the performance of a binary classifier. Report performance measures
@@ -36,7 +55,11 @@ class ConfusionMatrix(object):
     def __init__(self, positive_label: str, negative_label: str) -> None:
         self._pos = positive_label
         self._neg = negative_label
-        self._c: Counter = Counter(TP=0, FP=0, TN=0, FN=0)
+        self._labels = frozenset((positive_label, negative_label))
+        # Counts of TP, FP, TN, FN, in that order
+        self._counts = [0, 0, 0, 0]
+        # Derived metrics, memoized until the next update
+        self._cache: dict = {}
 
     def update(self, actual_label: str, predicted_label: str) -> None:
         '''
@@ -50,27 +73,91 @@ class ConfusionMatrix(object):
             raise ValueError(
                 'prediction %r is not a known label' % predicted_label)
 
-        if predicted_label == self._pos:
-            if predicted_label == actual_label:
-                self._c['TP'] += 1
-            else:
-                self._c['FP'] += 1
+        # Index as (predicted negative, prediction wrong) bits: 0 TP, 1 FP,
+        # 2 TN, 3 FN
+        self._counts[
+            (predicted_label != self._pos) << 1
+            | (predicted_label != actual_label)] += 1
 
-        elif predicted_label == self._neg:
-            if predicted_label == actual_label:
-                self._c['TN'] += 1
-            else:
-                self._c['FN'] += 1
+        if self._cache:
+            self._cache.clear()
 
     def updates(self, *results: Tuple[str, str]) -> None:
         '''
         Process a list of classifications. Each `result' should be a 2-tuple
         with the actual label on the left and the predicted label on the right.
         '''
+        labels = self._labels
+        pos = self._pos
+        counts = self._counts
+        self._cache.clear()
         for actual, predicted in results:
-            self.update(actual, predicted)
-
-    @property
+            if actual not in labels:
+                raise ValueError('label %r is not a known label' % actual)
+            if predicted not in labels:
+                raise ValueError(
+                    'prediction %r is not a known label' % predicted)
+            counts[(predicted != pos) << 1 | (predicted != actual)] += 1
+
+    def update_batch(
+            self,
+            actuals: Sequence[str],
+            predicteds: Sequence[str]) -> None:
+        '''
+        Process parallel sequences of actual and predicted labels. Nothing is
+        counted if any label is unknown. NumPy arrays are compared with their
+        own vectorized operators; anything else is tallied with a Counter so
+        only the (at most four) distinct pairs are looked at in Python. Raises
+        ValueError if the two aren't the same length (or shape, for arrays).
+
+        >>> m = ConfusionMatrix('win', 'lose')
+        >>> m.update_batch(['win', 'win', 'lose'], ['win', 'lose', 'lose'])
+        >>> m.TP, m.FN, m.TN
+        (1, 1, 1)
+        >>> m.update_batch(['win', 'lose'], ['win'])
+        Traceback (most recent call last):
+          ...
+        ValueError: actuals and predicteds differ in size: 2 vs 1
+        '''
+        # zip would silently truncate, and arrays would broadcast
+        if len(actuals) != len(predicteds):
+            raise ValueError(
+                'actuals and predicteds differ in size: %r vs %r'
+                % (len(actuals), len(predicteds)))
+        if _isndarray(actuals) and _isndarray(predicteds):
+            if actuals.shape != predicteds.shape:
+                raise ValueError(
+                    'actuals and predicteds differ in shape: %r vs %r'
+                    % (actuals.shape, predicteds.shape))
+            pos_a, neg_a = actuals == self._pos, actuals == self._neg
+            pos_p, neg_p = predicteds == self._pos, predicteds == self._neg
+            for labels, known, what in (
+                    (actuals, pos_a | neg_a, 'label'),
+                    (predicteds, pos_p | neg_p, 'prediction')):
+                if not known.all():
+                    raise ValueError('%s %r is not a known label'
+                                     % (what, labels[~known][0]))
+            batch = (
+                (pos_p & pos_a).sum(), (pos_p & neg_a).sum(),
+                (neg_p & neg_a).sum(), (neg_p & pos_a).sum())
+        else:
+            pairs = Counter(zip(actuals, predicteds))
+            batch = [0, 0, 0, 0]
+            for (actual, predicted), count in pairs.items():
+                if actual not in self._labels:
+                    raise ValueError('label %r is not a known label' % actual)
+                if predicted not in self._labels:
+                    raise ValueError(
+                        'prediction %r is not a known label' % predicted)
+                batch[(predicted != self._pos) << 1
+                      | (predicted != actual)] += count
+
+        counts = self._counts
+        for i, count in enumerate(batch):
+            counts[i] += int(count)
+        self._cache.clear()
+
+    @_cachedmetric
     def accuracy(self) -> float:
         '''
         Report the accuracy of the model (proportion of predictions which we
@@ -79,7 +166,7 @@ class ConfusionMatrix(object):
         '''
         return (self.TP + self.TN) / len(self)
 
-    @property
+    @_cachedmetric
     def error(self) -> float:
         '''
         Report the model's error rate (another way to frame accuracy). Gives
@@ -88,7 +175,7 @@ class ConfusionMatrix(object):
         '''
         return (self.FP + self.FN) / len(self)
 
-    @property
+    @_cachedmetric
     def sensitivity(self) -> float:
         '''
         True positive recognition rate (for data sets with heavy class
@@ -97,7 +184,7 @@ class ConfusionMatrix(object):
         '''
         return self.TP / (self.TP + self.FN)
 
-    @property
+    @_cachedmetric
     def specificity(self) -> float:
         '''
         True negative recognition rate
@@ -105,7 +192,7 @@ class ConfusionMatrix(object):
         '''
         return self.TN / (self.TN + self.FP)
 
-    @property
+    @_cachedmetric
     def precision(self) -> float:
         '''
         Report the precision of the model. Signals how exact the model is by
@@ -115,7 +202,7 @@ class ConfusionMatrix(object):
         '''
         return self.TP / (self.TP + self.FP)
 
-    @property
+    @_cachedmetric
     def recall(self) -> float:
         '''
         Proportion of positive instances labeled as such by the model.
@@ -123,7 +210,7 @@ class ConfusionMatrix(object):
         '''
         return self.TP / (self.TP + self.FN)
 
-    @property
+    @_cachedmetric
     def f1(self) -> float:
         '''
         Gives the balanced F measure for the model.
@@ -137,7 +224,7 @@ class ConfusionMatrix(object):
         '''
         Count of true positives (actual and prediction both positive) observed.
         '''
-        return self._c['TP']
+        return self._counts[0]
 
     @property
     def FP(self) -> int:
@@ -145,14 +232,14 @@ class ConfusionMatrix(object):
         Count of false positives (predicted positive for negative instance)
         observed.
         '''
-        return self._c['FP']
+        return self._counts[1]
 
     @property
     def TN(self) -> int:
         '''
         Count of true negatives (actual and prediction both negative) observed.
         '''
-        return self._c['TN']
+        return self._counts[2]
 
     @property
     def FN(self) -> int:
@@ -160,15 +247,11 @@ class ConfusionMatrix(object):
         Count of false negatives (predicted false for a positive instance)
         observed.
         '''
-        return self._c['FN']
-
-    @property
-    def _labels(self) -> set:
-        return {self._pos, self._neg}
+        return self._counts[3]
 
     def __len__(self) -> int:
         '''Corresponds to the number of predictions observed.'''
-        return sum(self._c.values())
+        return sum(self._counts)
 
     def __str__(self) -> str:
         '''Gives a nice, relatively pretty-printed table of results.'''
@@ -185,6 +268,8 @@ def mean(a: Sequence[Real]) -> float:
     >>> mean([1, 2, 3, 4])
     2.5
     '''
+    if _isndarray(a):
+        return float(a.mean())
     return sum(a) / len(a)
 
 
@@ -197,10 +282,20 @@ def median(a: Sequence[Real]) -> float:
     >>> median([1, 1, 2, 3])
     1.5
     '''
-    if _isodd(len(a)):
-        return float(sorted(a)[len(a) // 2])
-    else:
-        return mean(sorted(a)[len(a) // 2 - 1:len(a) // 2 + 1])
+    n = len(a)
+    mid = n // 2
+    if _isndarray(a):
+        # O(n) selection with the array's own partition, on a copy
+        part = a.copy()
+        if n & 1:
+            part.partition(mid)
+            return float(part[mid])
+        part.partition([mid - 1, mid])
+        return float((part[mid - 1] + part[mid]) / 2)
+    ordered = sorted(a)
+    if n & 1:
+        return float(ordered[mid])
+    return (ordered[mid - 1] + ordered[mid]) / 2
 
 
 def variance(a: Sequence[Real]) -> float:
@@ -212,16 +307,26 @@ def variance(a: Sequence[Real]) -> float:
     >>> variance([1, 1, 1, 1])
     1.0
     '''
+    if _isndarray(a):
+        return float(a.var())
     avg = mean(a)
-    return mean([(avg - e) ** 2 for e in a])
+    deviations = [e - avg for e in a]
+    # Square and sum the deviations in C
+    return sum(map(mul, deviations, deviations)) / len(a)
 
 
 def std(a: Sequence[Real]) -> float:
     '''
     Gives the standard deviation of a list of numbers (sqrt(variance)).
     '''
+    if _isndarray(a):
+        return float(a.std())
     return variance(a) ** 0.5
 
 
-def _isodd(n):
-    return n % 2 != 0
+def _isndarray(a: Any) -> bool:
+    '''
+    Check for a NumPy array without importing NumPy (which isn't a dependency;
+    arrays are only handed off to their own vectorized methods).
+    '''
+    return type(a).__module__ == 'numpy'
@@ -17,7 +17,8 @@ from numbers import Real
 from random import random
 from time import sleep, time
 from typing import (
-    Any, Callable, Generator, Iterable, Optional, Tuple, Type, Union)
+    Any, Callable, Generator, Iterable, Iterator, Optional, Tuple, Type,
+    Union)
 
 __all__ = [
     'pair',
@@ -73,18 +74,23 @@ def retry(
     >>> fetch(URL)
     <Response [200]>
     '''
+    catch = exceptions if isinstance(exceptions, tuple) else (exceptions,)
+
     def _impl(f):
         @wraps(f)
         def _wrapper(*args, **kwargs):
-            attempts = count() if times is None else range(times)
-            first_pass = True
+            # The first attempt never waits, so make it before the loop
+            try:
+                return f(*args, **kwargs)
+            except catch:
+                pass
+            attempts = count(1) if times is None else range(1, times)
             for _ in attempts:
-                if not first_pass:
+                if wait:
                     sleep(wait)
-                first_pass = False
                 try:
                     return f(*args, **kwargs)
-                except exceptions:
+                except catch:
                     pass
             if default is not None:
                 return default
@@ -137,13 +143,20 @@ class timeout(ContextDecorator):
     Waited 5 seconds
     '''
 
-    def __init__(self, duration: int=5) -> None:
+    def __init__(self, duration: float=5) -> None:
         self.duration = duration
-        signal.signal(signal.SIGALRM, self._raisetimeout)
+        # (handler, timer) pairs to restore on exit; a stack so the same
+        # instance can be re-entered (e.g. a decorated recursive function)
+        self._saved: list = []
 
     def __enter__(self) -> 'timeout':
-        '''Start the block and the timer.'''
-        signal.alarm(self.duration)
+        '''
+        Start the block and the timer. Any SIGALRM handler and pending timer
+        already in place are saved, so timeouts nest.
+        '''
+        handler = signal.signal(signal.SIGALRM, self._raisetimeout)
+        pending, _ = signal.setitimer(signal.ITIMER_REAL, self.duration)
+        self._saved.append((handler, pending))
         return self
 
     def __exit__(
@@ -151,13 +164,21 @@ class timeout(ContextDecorator):
             exception_t=Exception,
             exception=None,
             traceback=None) -> None:
-        '''Cancel the alarm when block finishes.'''
-        signal.alarm(0)
+        '''Cancel the timer when block finishes and restore the old one.'''
+        remaining, _ = signal.setitimer(signal.ITIMER_REAL, 0)
+        handler, pending = self._saved.pop()
+        signal.signal(
+            signal.SIGALRM, signal.SIG_DFL if handler is None else handler)
+        if pending:
+            # Charge the outer timer for the time spent in this block; if it
+            # has already run out, let it fire right away
+            elapsed = self.duration - remaining
+            signal.setitimer(signal.ITIMER_REAL, max(pending - elapsed, 1e-6))
 
     def _raisetimeout(self, signum: int, frame: Any) -> None:
         '''Trap the alarm signal.'''
         raise TimeoutError(
-            'Time allotment of %d second%s expired'
+            'Time allotment of %g second%s expired'
             % (self.duration, 's' if self.duration != 1 else ''))
 
 
@@ -201,17 +222,24 @@ class slow(object):
         return _impl
 
 
-def uniq(a: Iterable) -> Generator:
+def uniq(a: Iterable) -> Iterator:
     '''
     Generate the argument iterator with the duplicate members removed.
 
     >>> list(uniq([1, 2, 2, 3]))
     [1, 2, 3]
     '''
+    # Materialized inputs can be deduplicated in one pass in C
+    if hasattr(a, '__len__'):
+        return iter(dict.fromkeys(a))
+    return _uniq_stream(a)
+
+
+def _uniq_stream(a: Iterable) -> Generator:
+    '''Lazy variant of `uniq' for streaming (unsized) inputs.'''
     seen: set = set()
+    seen_add = seen.add
     for e in a:
         if e not in seen:
-            seen.add(e)
+            seen_add(e)
             yield e
-        else:
-            continue
@@ -9,11 +9,13 @@ Will Badart <wbadart@live.com>
 created: JAN 2018
 '''
 
-from collections import OrderedDict
-from queue import Queue as StdQueue
-from threading import Event, Lock, Thread
-from typing import Callable, Dict, Hashable, Iterable, List, TypeVar
-from uuid import uuid4
+from collections import deque
+from itertools import count, islice
+from queue import Queue as StdQueue, SimpleQueue
+from threading import Event, Thread
+from typing import (
+    Any, Callable, Deque, Dict, Hashable, Iterable, Iterator, List, Optional,
+    Tuple, TypeVar)
 
 __all__ = [
     'Pipeline',
@@ -22,20 +24,60 @@ __all__ = [
 _FuncArgT = TypeVar('_FuncArgT')
 _FuncRetT = TypeVar('_FuncRetT')
 
+# Stands in for a map result that hasn't been computed yet
+_PENDING = object()
+# Queued in place of a key to tell a worker to exit
+_STOP = object()
+
+
+class _Slot(object):
+    '''
+    Holds the result of a single item, or the exception func raised for it.
+    Only the worker that processes the item writes to it, and readers wait on
+    `event' first, so no lock needed.
+    '''
+    __slots__ = ('event', 'result', 'error')
+
+    def __init__(self) -> None:
+        self.event = Event()
+        self.result = None
+        self.error: Optional[BaseException] = None
+
+    def value(self) -> Any:
+        '''Return the result, re-raising func's exception if there was one.'''
+        if self.error is not None:
+            raise self.error
+        return self.result
+
 
 class Pipeline(object):
     '''
     Simplify the interface provided by standard library queue. Specifically
     tailored to processing lists of data.
     '''
+    __slots__ = (
+        '_q', '_func', '_threads', '_nthreads', '_slots', '_keygen',
+        '_errors', '_started', '_stopped')
 
     def __init__(
             self,
             func: Callable[[_FuncArgT], _FuncRetT],
             maxsize: int=0,
             nthreads: int=4) -> None:
+        '''
+        Apply `func' on `nthreads' worker threads. `maxsize' bounds the number
+        of queued messages (items from put/imap, chunks from map/apply), so a
+        fast producer blocks instead of buffering the whole input; 0 (or less,
+        as with queue.Queue) means unbounded. A bound below `nthreads' can't
+        keep every worker busy, so something like nthreads * 4 is a
+        reasonable starting point.
+        '''
+        if nthreads < 1:
+            raise ValueError('nthreads must be positive, got %r' % nthreads)
 
-        self._q: StdQueue = StdQueue(maxsize)
+        # SimpleQueue is C-implemented and skips task accounting; only a
+        # bounded queue needs the full Queue machinery
+        self._q = SimpleQueue() if maxsize <= 0 else StdQueue(maxsize)
         self._func = func
 
         self._threads: List[Thread] = []
@@ -43,25 +85,49 @@ class Pipeline(object):
             self._threads.append(Thread(target=self._worker))
         self._nthreads = nthreads
 
-        self._results: OrderedDict[Hashable, _FuncRetT] = OrderedDict()
-        self._result_lock = Lock()
-        self._events: Dict[Hashable, Event] = {}
+        self._slots: Dict[Hashable, _Slot] = {}
+        # count's __next__ is a single C call, so it's safe across threads
+        self._keygen = count().__next__
+        # Exceptions raised by func under map/apply, in the order they were
+        # caught (list.append is atomic, so the first one really is first)
+        self._errors: List[BaseException] = []
 
         # Track queue state; enforce one-time usage
         self._started = False
         self._stopped = False
 
     def _worker(self) -> None:
+        # Bind everything the loop touches to locals once
+        get = self._q.get
+        func = self._func
+        errors = self._errors
         while True:
-            key, item, event = self._q.get()
-            if key is None:
-                self._q.task_done()
+            key, items, slot, results = get()
+            if key is _STOP:
                 break
-            result = self._func(item)
-            with self._result_lock:
-                self._results[key] = result
-            event.set()
-            self._q.task_done()
+            if slot is not None:
+                # Always set the event, so a failed item can't leave its
+                # reader waiting forever
+                try:
+                    slot.result = func(items[0])
+                except Exception as exc:
+                    slot.error = exc
+                finally:
+                    slot.event.set()
+                continue
+            try:
+                if results is None:
+                    for item in items:
+                        func(item)
+                # Chunk submitted by map: `key' is the index of its first item
+                elif len(items) == 1:
+                    results[key] = func(items[0])
+                else:
+                    results[key:key + len(items)] = map(func, items)
+            except Exception as exc:
+                # Keep the worker alive; map/apply re-raise the first error
+                # once every worker has stopped
+                errors.append(exc)
 
     def __enter__(self) -> 'Pipeline':
         '''Start threads.'''
@@ -77,51 +143,165 @@ class Pipeline(object):
             exception_t=Exception,
             exception=None,
             traceback=None) -> None:
-        '''Stop and join the threads.'''
+        '''
+        Stop and join the threads. Does nothing if the Pipeline has already
+        been stopped (e.g. by map or imap inside a `with' block).
+        '''
+        if self._stopped:
+            return
         for thread in self._threads:
-            self._q.put((None, None, None))
+            self._q.put((_STOP, None, None, None))
+        # Every item ahead of the sentinels is done once the threads exit
         for thread in self._threads:
             thread.join()
-        self._q.join()
         self._stopped = True
 
     def put(self, item: _FuncArgT, key: Hashable=None) -> Hashable:
-        '''Add an item to apply func to.'''
+        '''
+        Add an item to apply func to. Returns the key to pass to `get'; when
+        no key is given, one is generated (an int, unique to this Pipeline).
+        '''
         if self._stopped:
             raise RuntimeError('this Pipeline has already been stopped')
-        if key is None and item is not None:
-            key = str(uuid4())
-        e = Event()
-        self._events[key] = e
-        self._q.put((key, item, e))
+        if key is None:
+            key = self._keygen()
+        slot = self._slots[key] = _Slot()
+        self._q.put((key, (item,), slot, None))
         return key
 
-    def get(self, key: Hashable, timeout: int=None) -> _FuncRetT:
-        '''Get the result from an individual item.'''
-        self._events[key].wait(timeout)
-        return self._results.get(key)
+    def get(self, key: Hashable, timeout: float=None) -> _FuncRetT:
+        '''
+        Get the result from an individual item. Raises TimeoutError if it isn't
+        ready within `timeout' seconds, and KeyError for an unknown key. If
+        func raised for the item, that exception is re-raised here.
+        '''
+        slot = self._slots[key]
+        if not slot.event.wait(timeout):
+            raise TimeoutError('result for key %r not ready' % (key,))
+        return slot.value()
 
-    def map(self, iterable: Iterable[_FuncArgT]) -> List[_FuncRetT]:
+    def map(
+            self,
+            iterable: Iterable[_FuncArgT],
+            chunksize: int=None) -> List[_FuncRetT]:
         '''
-        Apply Pipeline.func to each item in the argument iterable.
+        Apply Pipeline.func to each item in the argument iterable. If func
+        raises, the first such exception is re-raised once the Pipeline has
+        shut down.
+
+        Items are handed to the workers `chunksize' at a time, so the queue is
+        touched once per chunk rather than once per item. When unspecified,
+        sized inputs are split into about four chunks per thread (as
+        multiprocessing.Pool.map does), and other iterables go one at a time.
         '''
+        if self._stopped:
+            raise RuntimeError('this Pipeline has already been stopped')
+        _check_chunksize(chunksize)
         if not self._started:
             self.start()
-        for i, item in enumerate(iterable):
-            self.put(item, key=i)
+        put = self._q.put
+        # Workers fill in results by index; shutting down joins them, so
+        # there's no need for per-item events here
+        if hasattr(iterable, '__len__'):
+            results: List[_FuncRetT] = [_PENDING] * len(iterable)
+            if chunksize is None:
+                chunksize = self._chunksize(len(results))
+            for start, chunk in _chunks(iterable, chunksize):
+                put((start, chunk, None, results))
+        else:
+            results = []
+            extend = results.extend
+            for start, chunk in _chunks(iterable, chunksize or 1):
+                # Reserve the chunk's slots until the worker fills them in
+                extend((_PENDING,) * len(chunk))
+                put((start, chunk, None, results))
         self.shutdown()
-        return [self._results[j] for j in range(i + 1)]
+        self._raise_error()
+        return results
+
+    def imap(
+            self,
+            iterable: Iterable[_FuncArgT],
+            window: int=None) -> Iterator[_FuncRetT]:
+        '''
+        Lazy variant of map: yield the results in order as they become
+        available, keeping at most `window' items (default: twice the number
+        of threads) in flight, so neither the input nor the output needs to
+        fit in memory. The Pipeline is shut down once the iterable is
+        exhausted (or the generator is closed). If func raises for an item,
+        that exception is raised in place of the item's result.
 
-    def apply(self, iterable: Iterable[_FuncArgT]) -> None:
+        >>> list(Pipeline(lambda x: 10 // x).imap([1, 2, 5]))
+        [10, 5, 2]
+        >>> results = Pipeline(lambda x: 10 // x).imap([2, 0, 5])
+        >>> next(results)
+        5
+        >>> next(results)
+        Traceback (most recent call last):
+          ...
+        ZeroDivisionError: integer division or modulo by zero
+        '''
+        if self._stopped:
+            raise RuntimeError('this Pipeline has already been stopped')
+        if window is None:
+            window = self._nthreads * 2
+        elif window < 1:
+            raise ValueError('window must be positive, got %r' % window)
+        if not self._started:
+            self.start()
+        put = self._q.put
+        pending: Deque[_Slot] = deque()
+        try:
+            for item in iterable:
+                # The key is unused for slot items
+                slot = _Slot()
+                put((0, (item,), slot, None))
+                pending.append(slot)
+                if len(pending) >= window:
+                    slot = pending.popleft()
+                    slot.event.wait()
+                    yield slot.value()
+            while pending:
+                slot = pending.popleft()
+                slot.event.wait()
+                yield slot.value()
+        finally:
+            self.shutdown()
+
+    def apply(
+            self,
+            iterable: Iterable[_FuncArgT],
+            chunksize: int=None) -> None:
         '''
         Procedure variant of map. Apply Pipeline.func over iterable, but do not
-        aggregate and return procedure results.
+        aggregate and return procedure results. `chunksize' and error handling
+        are as for map.
         '''
+        if self._stopped:
+            raise RuntimeError('this Pipeline has already been stopped')
+        _check_chunksize(chunksize)
         if not self._started:
             self.start()
-        for e in iterable:
-            self.put(e)
+        if chunksize is None:
+            chunksize = (
+                self._chunksize(len(iterable))
+                if hasattr(iterable, '__len__') else 1)
+        # Results are discarded, so skip put's key and slot bookkeeping
+        put = self._q.put
+        for start, chunk in _chunks(iterable, chunksize):
+            put((start, chunk, None, None))
         self.shutdown()
+        self._raise_error()
+
+    def _raise_error(self) -> None:
+        '''Re-raise the first exception func raised under map/apply, if any.'''
+        if self._errors:
+            raise self._errors[0]
+
+    def _chunksize(self, n: int) -> int:
+        '''Default chunk size for `n' items: about four chunks per thread.'''
+        chunksize, extra = divmod(n, self._nthreads * 4)
+        return chunksize + 1 if extra else max(chunksize, 1)
 
     @property
     def func(self) -> Callable[[_FuncArgT], _FuncRetT]:
@@ -131,3 +311,30 @@ class Pipeline(object):
     # Nice aliases for context functions, for use when `with' not appropriate
     start = __enter__
     shutdown = __exit__
+
+
+def _check_chunksize(chunksize: Optional[int]) -> None:
+    '''Reject a chunk size that would never yield any items.'''
+    if chunksize is not None and chunksize < 1:
+        raise ValueError('chunksize must be positive, got %r' % chunksize)
+
+
+def _chunks(iterable: Iterable, size: int) -> Iterator[Tuple[int, tuple]]:
+    '''
+    Split `iterable' into tuples of up to `size' items, each paired with the
+    index of its first item.
+    '''
+    if size == 1:
+        # zip over a single iterable already yields 1-tuples, all in C
+        return zip(count(), zip(iterable))
+    return _islice_chunks(iter(iterable), size)
+
+
+def _islice_chunks(it: Iterator, size: int) -> Iterator[Tuple[int, tuple]]:
+    '''Generator behind `_chunks' for sizes greater than one.'''
+    start = 0
+    chunk = tuple(islice(it, size))
+    while chunk:
+        yield start, chunk
+        start += len(chunk)
+        chunk = tuple(islice(it, size))